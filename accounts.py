@@ -0,0 +1,86 @@
+"""
+ユーザーの引き継ぎ
+
+ユーザーはブラウザのセッションCookieで識別するため、Cookieが失われると
+ブラウザからは同じユーザーに戻れない。CLIで発行した署名付きのリンクを開くと、
+そのブラウザが指定したユーザーとして扱われる（移行時の引き継ぎ用ユーザー、
+Cookieの期限切れ、別の端末への移行などに使う）。
+"""
+import click
+from flask import Blueprint, current_app, flash, redirect, session, url_for
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from models import db, User, Clothing
+from tenancy import tenant_context, iter_tenant_ids
+
+accounts_bp = Blueprint('accounts', __name__, cli_group='users')
+
+
+# ===== 引き継ぎトークン =====
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='claim-user')
+
+
+def make_claim_token(user_id):
+    """ユーザーの引き継ぎトークンを発行"""
+    return _serializer().dumps(user_id)
+
+
+def load_claim_token(token):
+    """
+    引き継ぎトークンからユーザーIDを取得
+
+    Returns:
+        str: ユーザーID（署名が不正・期限切れ・ユーザーが存在しない場合はNone）
+    """
+    try:
+        user_id = _serializer().loads(token, max_age=current_app.config['CLAIM_LINK_MAX_AGE'])
+    except BadSignature:  # 期限切れ（SignatureExpired）を含む
+        return None
+    if db.session.get(User, user_id) is None:
+        return None
+    return user_id
+
+
+# ===== ルート定義 =====
+
+@accounts_bp.route('/claim/<string:token>')
+def claim(token):
+    """引き継ぎリンクを開いたブラウザを指定したユーザーにする"""
+    user_id = load_claim_token(token)
+    if user_id is None:
+        flash('引き継ぎリンクが無効か、有効期限が切れています', 'error')
+        return redirect(url_for('index'))
+
+    session['user_id'] = user_id
+    session.permanent = True
+    flash('クローゼットを引き継ぎました', 'success')
+    return redirect(url_for('index'))
+
+
+# ===== CLIコマンド =====
+
+@accounts_bp.cli.command('list')
+def list_command():
+    """ユーザーの一覧（作成日時と服の数）を表示"""
+    for user_id in iter_tenant_ids():
+        user = db.session.get(User, user_id)
+        with tenant_context(user_id):
+            count = Clothing.query.filter_by(user_id=user_id).count()
+        click.echo(f'{user_id}  {user.created_at:%Y-%m-%d %H:%M}  服{count}件')
+
+
+@accounts_bp.cli.command('claim-link')
+@click.argument('user_id')
+@click.option('--base-url', default='http://localhost:5000', show_default=True,
+              help='リンクのURLの先頭部分')
+def claim_link_command(user_id, base_url):
+    """ブラウザでユーザーを引き継ぐためのリンクを発行"""
+    if db.session.get(User, user_id) is None:
+        raise click.ClickException(f'ユーザーが見つかりません: {user_id}')
+
+    with current_app.test_request_context(base_url=base_url):
+        url = url_for('accounts.claim', token=make_claim_token(user_id), _external=True)
+    click.echo(url)
+    click.echo(f'有効期限: {current_app.config["CLAIM_LINK_MAX_AGE"] // (24 * 60 * 60)}日')
@@ -1,15 +1,24 @@
 """
 fashion-app メインアプリケーション
 """
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime, date
 import uuid
 
 from config import Config
-from models import db, Clothing, Settings, Schedule
+from models import db, Clothing, Schedule
+from migrations import upgrade_database
 from utils import get_weather_info, generate_outfit_suggestions
+from accounts import accounts_bp
+from backup import backup_bp
+from storage import storage_cli, remove_upload, register_uploads, unregister_uploads
+from template_cache import init_template_cache, invalidate_clothing
+from tenancy import (
+    load_current_user, ensure_current_user, tenant_query, get_tenant_or_404,
+    get_setting, set_setting
+)
 
 
 def create_app(config_class=Config):
@@ -17,15 +26,34 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # テンプレートキャッシュ（Jinja環境の生成前に設定する）
+    init_template_cache(app)
+    
     # データベース初期化
     db.init_app(app)
     
     # アップロードフォルダが存在しない場合は作成
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
-    # データベーステーブル作成
+    # データベーステーブル作成と、既存のデータベースの移行
     with app.app_context():
         db.create_all()
+        upgrade_database()
+    
+    # ユーザーの引き継ぎ（リンクとCLIコマンド）
+    app.register_blueprint(accounts_bp)
+    
+    # バックアップ機能（エクスポート／リストア）
+    app.register_blueprint(backup_bp)
+    
+    # アップロード画像の管理コマンド
+    app.cli.add_command(storage_cli)
+    
+    @app.before_request
+    def before_request():
+        """リクエストのユーザーを特定"""
+        if request.endpoint != 'static':
+            load_current_user()
     
     # ===== ユーティリティ関数 =====
     
@@ -42,27 +70,28 @@ def create_app(config_class=Config):
         today = date.today()
         
         # 今日の予定をカレンダーから取得
-        today_schedule = Schedule.query.filter_by(date=today).first()
+        today_schedule = tenant_query(Schedule).filter_by(date=today).first()
         
         # 手動選択またはカレンダーからの予定を使用
         if request.method == 'POST':
             # 手動で予定を選択した場合
             selected_purpose = request.form.get('purpose')
-            session['purpose'] = selected_purpose
+            set_setting('purpose', selected_purpose)
+            db.session.commit()
             auto_selected = False
         elif today_schedule:
             # カレンダーに予定がある場合は自動選択
             selected_purpose = today_schedule.purpose
             auto_selected = True
         else:
-            # カレンダーに予定がない場合はセッションまたはデフォルト
-            selected_purpose = session.get('purpose', '大学')
+            # カレンダーに予定がない場合は前回の選択またはデフォルト
+            selected_purpose = get_setting('purpose', '大学')
             auto_selected = False
         
         # 天気情報取得（位置情報がある場合は使用）
-        user_lat = session.get('user_latitude')
-        user_lon = session.get('user_longitude')
-        user_city = session.get('user_city')
+        user_lat = get_setting('user_latitude')
+        user_lon = get_setting('user_longitude')
+        user_city = get_setting('user_city')
         
         if user_lat and user_lon:
             weather = get_weather_info(latitude=user_lat, longitude=user_lon)
@@ -70,7 +99,7 @@ def create_app(config_class=Config):
             weather = get_weather_info(city=user_city)
         
         # 服のリストを取得
-        all_clothes = Clothing.query.all()
+        all_clothes = tenant_query(Clothing).all()
         
         # コーディネート提案を生成
         suggestions = []
@@ -94,7 +123,7 @@ def create_app(config_class=Config):
     @app.route('/closet')
     def closet():
         """クローゼット一覧画面"""
-        clothes = Clothing.query.order_by(Clothing.created_at.desc()).all()
+        clothes = tenant_query(Clothing).order_by(Clothing.created_at.desc()).all()
         return render_template('closet.html', clothes=clothes)
     
     @app.route('/closet/new')
@@ -137,9 +166,15 @@ def create_app(config_class=Config):
         # データベースには相対パスを保存
         relative_path = f"uploads/{filename}"
         
+        # 画像の所有者を服より先に登録
+        user_id = ensure_current_user()
+        register_uploads([relative_path], user_id)
+        db.session.commit()
+        
         # DB保存
         purposes_str = ','.join(purposes)
         new_clothing = Clothing(
+            user_id=user_id,
             photo_path=relative_path,
             category=category,
             subcategory=subcategory,
@@ -157,13 +192,13 @@ def create_app(config_class=Config):
     @app.route('/closet/edit/<string:clothing_id>')
     def closet_edit(clothing_id):
         """服編集画面"""
-        clothing = Clothing.query.get_or_404(clothing_id)
+        clothing = get_tenant_or_404(Clothing, clothing_id)
         return render_template('closet_form.html', clothing=clothing)
     
     @app.route('/closet/update/<string:clothing_id>', methods=['POST'])
     def closet_update(clothing_id):
         """服更新処理"""
-        clothing = Clothing.query.get_or_404(clothing_id)
+        clothing = get_tenant_or_404(Clothing, clothing_id)
         
         # 必須項目チェック
         category = request.form.get('category')
@@ -176,19 +211,18 @@ def create_app(config_class=Config):
             return redirect(url_for('closet_edit', clothing_id=clothing_id))
         
         # 写真が新しくアップロードされた場合
+        old_photo_path = None
         if 'photo' in request.files:
             photo = request.files['photo']
             if photo.filename != '' and allowed_file(photo.filename):
-                # 古い画像を削除
-                old_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], 
-                                            clothing.photo_path.replace('uploads/', ''))
-                if os.path.exists(old_photo_path):
-                    os.remove(old_photo_path)
-                
-                # 新しい画像を保存
+                # 新しい画像を保存し、所有者を服より先に登録
                 filename = f"{uuid.uuid4()}_{secure_filename(photo.filename)}"
                 photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                 photo.save(photo_path)
+                register_uploads([f"uploads/{filename}"], clothing.user_id)
+                db.session.commit()
+                
+                old_photo_path = clothing.photo_path
                 clothing.photo_path = f"uploads/{filename}"
         
         # 更新
@@ -198,6 +232,12 @@ def create_app(config_class=Config):
         clothing.purposes = ','.join(purposes)
         
         db.session.commit()
+        invalidate_clothing(clothing_id)
+        
+        # 古い画像はコミット後に削除
+        if old_photo_path:
+            remove_upload(old_photo_path)
+            unregister_uploads([old_photo_path])
         
         flash('服を更新しました', 'success')
         return redirect(url_for('closet'))
@@ -205,17 +245,17 @@ def create_app(config_class=Config):
     @app.route('/closet/delete/<string:clothing_id>', methods=['POST'])
     def closet_delete(clothing_id):
         """服削除処理"""
-        clothing = Clothing.query.get_or_404(clothing_id)
-        
-        # 画像ファイルを削除
-        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], 
-                                clothing.photo_path.replace('uploads/', ''))
-        if os.path.exists(photo_path):
-            os.remove(photo_path)
+        clothing = get_tenant_or_404(Clothing, clothing_id)
+        photo_path = clothing.photo_path
         
         # データベースから削除
         db.session.delete(clothing)
         db.session.commit()
+        invalidate_clothing(clothing_id)
+        
+        # 画像ファイルはコミット後に削除
+        remove_upload(photo_path)
+        unregister_uploads([photo_path])
         
         flash('服を削除しました', 'success')
         return redirect(url_for('closet'))
@@ -233,8 +273,8 @@ def create_app(config_class=Config):
         # 最終着用日を今日に更新
         today = date.today()
         
-        top = Clothing.query.get(top_id)
-        bottom = Clothing.query.get(bottom_id)
+        top = tenant_query(Clothing).filter_by(id=top_id).first()
+        bottom = tenant_query(Clothing).filter_by(id=bottom_id).first()
         
         if top:
             top.last_worn_date = today
@@ -242,6 +282,7 @@ def create_app(config_class=Config):
             bottom.last_worn_date = today
         
         db.session.commit()
+        invalidate_clothing(top_id, bottom_id)
         
         flash('着用記録を保存しました！', 'success')
         return redirect(url_for('index'))
@@ -249,9 +290,10 @@ def create_app(config_class=Config):
     @app.route('/reset-worn-date/<string:clothing_id>', methods=['POST'])
     def reset_worn_date(clothing_id):
         """個別の着用記録をリセット"""
-        clothing = Clothing.query.get_or_404(clothing_id)
+        clothing = get_tenant_or_404(Clothing, clothing_id)
         clothing.last_worn_date = None
         db.session.commit()
+        invalidate_clothing(clothing_id)
         
         flash(f'{clothing.category}の着用記録をリセットしました', 'success')
         return redirect(url_for('closet'))
@@ -259,13 +301,15 @@ def create_app(config_class=Config):
     @app.route('/reset-all-worn-dates', methods=['POST'])
     def reset_all_worn_dates():
         """全ての着用記録を一括リセット"""
-        clothes = Clothing.query.filter(Clothing.last_worn_date.isnot(None)).all()
+        clothes = tenant_query(Clothing).filter(Clothing.last_worn_date.isnot(None)).all()
         count = len(clothes)
+        clothing_ids = [clothing.id for clothing in clothes]
         
         for clothing in clothes:
             clothing.last_worn_date = None
         
         db.session.commit()
+        invalidate_clothing(*clothing_ids)
         
         flash(f'{count}件の着用記録をリセットしました', 'success')
         return redirect(url_for('closet'))
@@ -275,10 +319,10 @@ def create_app(config_class=Config):
         """カレンダー画面（予定一覧）"""
         # 今日以降の予定を取得
         today = date.today()
-        schedules = Schedule.query.filter(Schedule.date >= today).order_by(Schedule.date).all()
+        schedules = tenant_query(Schedule).filter(Schedule.date >= today).order_by(Schedule.date).all()
         
         # 過去の予定も取得（オプション）
-        past_schedules = Schedule.query.filter(Schedule.date < today).order_by(Schedule.date.desc()).limit(10).all()
+        past_schedules = tenant_query(Schedule).filter(Schedule.date < today).order_by(Schedule.date.desc()).limit(10).all()
         
         return render_template(
             'calendar.html',
@@ -311,13 +355,14 @@ def create_app(config_class=Config):
             return redirect(url_for('calendar_new'))
         
         # 同じ日に予定が既に存在するかチェック
-        existing = Schedule.query.filter_by(date=schedule_date).first()
+        existing = tenant_query(Schedule).filter_by(date=schedule_date).first()
         if existing:
             flash(f'{schedule_date.strftime("%Y年%m月%d日")}には既に予定が登録されています', 'error')
             return redirect(url_for('calendar_new'))
         
         # 予定を保存
         new_schedule = Schedule(
+            user_id=ensure_current_user(),
             date=schedule_date,
             purpose=purpose,
             memo=memo
@@ -332,13 +377,13 @@ def create_app(config_class=Config):
     @app.route('/calendar/edit/<string:schedule_id>')
     def calendar_edit(schedule_id):
         """予定編集画面"""
-        schedule = Schedule.query.get_or_404(schedule_id)
+        schedule = get_tenant_or_404(Schedule, schedule_id)
         return render_template('calendar_form.html', schedule=schedule)
     
     @app.route('/calendar/update/<string:schedule_id>', methods=['POST'])
     def calendar_update(schedule_id):
         """予定更新処理"""
-        schedule = Schedule.query.get_or_404(schedule_id)
+        schedule = get_tenant_or_404(Schedule, schedule_id)
         
         schedule_date = request.form.get('date')
         purpose = request.form.get('purpose')
@@ -356,7 +401,7 @@ def create_app(config_class=Config):
             return redirect(url_for('calendar_edit', schedule_id=schedule_id))
         
         # 同じ日に別の予定が既に存在するかチェック
-        existing = Schedule.query.filter(
+        existing = tenant_query(Schedule).filter(
             Schedule.date == schedule_date,
             Schedule.id != schedule_id
         ).first()
@@ -377,7 +422,7 @@ def create_app(config_class=Config):
     @app.route('/calendar/delete/<string:schedule_id>', methods=['POST'])
     def calendar_delete(schedule_id):
         """予定削除処理"""
-        schedule = Schedule.query.get_or_404(schedule_id)
+        schedule = get_tenant_or_404(Schedule, schedule_id)
         
         db.session.delete(schedule)
         db.session.commit()
@@ -397,11 +442,11 @@ def create_app(config_class=Config):
             if not latitude or not longitude:
                 return jsonify({'success': False, 'error': '位置情報が不正です'})
             
-            # セッションに位置情報を保存
-            session['user_latitude'] = latitude
-            session['user_longitude'] = longitude
-            if city:
-                session['user_city'] = city
+            # ユーザー設定に位置情報を保存
+            set_setting('user_latitude', latitude)
+            set_setting('user_longitude', longitude)
+            set_setting('user_city', city or None)  # 都市名がない場合は前回の値を消す
+            db.session.commit()
             
             return jsonify({'success': True})
             
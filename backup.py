@@ -0,0 +1,440 @@
+"""
+バックアップ（エクスポート／リストア）機能
+
+データはNDJSON（1行1レコード）、写真はZIPとしてストリーミング出力する。
+どちらもジェネレータで少しずつ書き出すため、クローゼットの規模に関係なく
+メモリ使用量は一定に保たれる。
+
+データはユーザー単位で出力する。画面からは自分のデータのみ、
+CLIからは全ユーザー（または指定したユーザー）のデータを扱う。
+"""
+import json
+import os
+import shutil
+import uuid
+import zipfile
+from datetime import date, datetime
+
+import click
+from flask import Blueprint, Response, current_app, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.utils import secure_filename
+
+from models import db, User, Clothing, Settings, Schedule
+from storage import to_upload_path, register_uploads
+from tenancy import current_user_id, tenant_context, iter_tenant_ids
+
+# エクスポート対象のユーザー単位のモデル（リストア時もこの順で投入する）
+BACKUP_MODELS = (Clothing, Schedule, Settings)
+
+# 1回のフェッチ／INSERTで扱う行数
+DEFAULT_BATCH_SIZE = 500
+
+# ZIPへ書き込む際のチャンクサイズ
+ZIP_CHUNK_SIZE = 64 * 1024
+
+backup_bp = Blueprint('backup', __name__, url_prefix='/backup', cli_group='backup')
+
+
+# ===== シリアライズ =====
+
+def _serialize_value(value):
+    """JSONに変換できない値を文字列に変換"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _deserialize_row(table, data):
+    """NDJSONの1レコードをカラム型に合わせて変換"""
+    row = {}
+    for column in table.columns:
+        if column.name not in data:
+            continue
+        value = data[column.name]
+        if value is not None:
+            # DateTimeはDateのサブクラスではないため個別に判定する
+            if isinstance(column.type, db.DateTime):
+                value = datetime.fromisoformat(value)
+            elif isinstance(column.type, db.Date):
+                value = date.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+# ===== エクスポート =====
+
+def _to_ndjson_line(table, row):
+    """1行をNDJSONの1行に変換"""
+    data = {key: _serialize_value(value) for key, value in row._mapping.items()}
+    return json.dumps({'table': table.name, 'data': data}, ensure_ascii=False) + '\n'
+
+
+def _iter_user_pages(table, user_id, batch_size):
+    """
+    ユーザーの行を主キーによるキーセットページングで生成
+
+    ページごとにトランザクションを終えるため、ダウンロードが遅い場合も
+    読み取りトランザクションを開いたままにしない。
+    """
+    key_column = next(column for column in table.primary_key.columns if column.name != 'user_id')
+    last_key = ''
+
+    with tenant_context(user_id):
+        while True:
+            stmt = db.select(table) \
+                .where(table.c.user_id == user_id, key_column > last_key) \
+                .order_by(key_column) \
+                .limit(batch_size)
+            rows = db.session.execute(stmt).all()
+            db.session.rollback()
+            if not rows:
+                break
+
+            yield rows
+            last_key = rows[-1]._mapping[key_column.name]
+
+
+def iter_ndjson(user_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    ユーザーの行をNDJSON形式で1行ずつ生成
+
+    ORMオブジェクトを経由せずCoreのSELECTをキーセットページングで読み出すため、
+    セッションのidentity mapにも行が溜まらない。
+
+    Args:
+        user_ids: 出力するユーザーIDのイテラブル
+        batch_size: 1回の問い合わせで取得する行数
+
+    Yields:
+        str: {"table": テーブル名, "data": {...}} の1行（改行付き）
+    """
+    user_table = User.__table__
+    for user_id in user_ids:
+        row = db.session.execute(
+            db.select(user_table).where(user_table.c.id == user_id)
+        ).first()
+        db.session.rollback()
+        if row is None:
+            continue
+        yield _to_ndjson_line(user_table, row)
+
+        for model in BACKUP_MODELS:
+            table = model.__table__
+            for rows in _iter_user_pages(table, user_id, batch_size):
+                for row in rows:
+                    yield _to_ndjson_line(table, row)
+
+
+class _ChunkBuffer:
+    """
+    ZipFileの書き込み先として使う非シーク可能なバッファ
+
+    書き込まれたバイト列を溜めておき、ジェネレータ側で都度取り出す。
+    tell/seekを持たないため、zipfileはデータディスクリプタ形式で出力する。
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """溜まっているバイト列を取り出して空にする"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_upload_files(upload_folder, user_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    ZIPに格納する写真ファイルのパスを列挙
+
+    ユーザーを指定した場合はその服の写真のみ、指定しない場合は
+    アップロードフォルダ直下の全ての写真を対象とする。
+    """
+    if user_id is None:
+        with os.scandir(upload_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    yield entry.path
+        return
+
+    for rows in _iter_user_pages(Clothing.__table__, user_id, batch_size):
+        for row in rows:
+            path = to_upload_path(row.photo_path, upload_folder)
+            if os.path.isfile(path):
+                yield path
+
+
+def iter_photos_zip(paths, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    写真のZIPをチャンク単位で生成
+
+    写真は既に圧縮済みの形式のため、無圧縮（ZIP_STORED）で格納する。
+
+    Args:
+        paths: 格納する写真ファイルのパスのイテラブル
+        chunk_size: ファイルを読み込む単位（バイト）
+
+    Yields:
+        bytes: ZIPデータの断片
+    """
+    buffer = _ChunkBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for path in paths:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname=os.path.basename(path))
+            with open(path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # セントラルディレクトリ
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+# ===== リストア =====
+
+def restore_ndjson(lines, batch_size=DEFAULT_BATCH_SIZE, replace=False, default_user_id=None):
+    """
+    NDJSONからデータをバッチ単位で一括INSERT
+
+    エクスポート時と同じくユーザー単位で投入し、ユーザーごとにコミットする。
+    既に存在する行（主キーが同じ行）はスキップするため、途中で失敗した場合も
+    同じファイルで再実行すれば残りを復元できる。
+
+    Args:
+        lines: NDJSONの行を返すイテラブル（ファイルオブジェクトなど）
+        batch_size: 1回のINSERTで投入する行数
+        replace: Trueの場合、各ユーザーの既存の行を削除してから投入する
+        default_user_id: user_id を持たない行（複数ユーザー対応前のバックアップ）の
+            割り当て先ユーザー。存在しない場合は作成する
+
+    Returns:
+        dict: {テーブル名: 投入件数（スキップした行は含まない）}
+
+    Raises:
+        ValueError: NDJSONの形式が正しくない場合、または user_id を持たない行があり
+            default_user_id が指定されていない場合（何行目かをメッセージに含む）
+    """
+    user_table = User.__table__
+    tables = {model.__table__.name: model.__table__ for model in BACKUP_MODELS}
+    counts = {name: 0 for name in (user_table.name, *tables)}
+    pending = {name: [] for name in tables}
+    current_user = None
+
+    def flush(name):
+        if pending[name]:
+            # 画像の所有者を服と同じトランザクションで登録（コミットは switch_user のみ）
+            if name == Clothing.__table__.name:
+                register_uploads([row['photo_path'] for row in pending[name]], current_user)
+
+            # 既に存在する行はスキップする（SQLite の INSERT OR IGNORE）
+            stmt = tables[name].insert().prefix_with('OR IGNORE', dialect='sqlite')
+            with tenant_context(current_user):
+                result = db.session.execute(stmt, pending[name])
+            counts[name] += result.rowcount
+            pending[name] = []
+
+    def switch_user(user_id):
+        nonlocal current_user
+        if current_user is not None:
+            for name in tables:
+                flush(name)
+            db.session.commit()
+
+        current_user = user_id
+        if replace and user_id is not None:
+            with tenant_context(user_id):
+                for table in tables.values():
+                    db.session.execute(table.delete().where(table.c.user_id == user_id))
+
+    try:
+        if default_user_id is not None and db.session.get(User, default_user_id) is None:
+            db.session.execute(user_table.insert(), [{'id': default_user_id, 'created_at': datetime.utcnow()}])
+            counts[user_table.name] += 1
+
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                record = json.loads(line)
+                name = record['table']
+                data = record['data']
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f'{line_number}行目の形式が正しくありません: {e}') from e
+
+            if name == user_table.name:
+                row = _deserialize_row(user_table, data)
+                if db.session.get(User, row['id']) is None:
+                    db.session.execute(user_table.insert(), [row])
+                    counts[name] += 1
+                continue
+
+            if name not in tables:
+                raise ValueError(f'{line_number}行目: 不明なテーブルです: {name}')
+
+            row = _deserialize_row(tables[name], data)
+            if row.get('user_id') is None:
+                if default_user_id is None:
+                    raise ValueError(
+                        f'{line_number}行目: user_id がありません'
+                        '（複数ユーザー対応前のバックアップは復元先のユーザー（--user）を指定してください）'
+                    )
+                row['user_id'] = default_user_id
+            if row['user_id'] != current_user:
+                switch_user(row['user_id'])
+
+            pending[name].append(row)
+            if len(pending[name]) >= batch_size:
+                flush(name)
+
+        switch_user(None)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return counts
+
+
+def restore_photos_zip(file, upload_folder=None, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    写真のZIPをアップロードフォルダへ展開
+
+    Args:
+        file: ZIPファイルのパスまたはファイルオブジェクト
+        upload_folder: 展開先（Noneの場合は設定から取得）
+        chunk_size: ファイルを書き込む単位（バイト）
+
+    Returns:
+        int: 展開したファイル数
+    """
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    count = 0
+
+    with zipfile.ZipFile(file) as zf:
+        for zinfo in zf.infolist():
+            if zinfo.is_dir():
+                continue
+            # ディレクトリトラバーサル対策としてファイル名のみ使用
+            filename = secure_filename(os.path.basename(zinfo.filename))
+            if not filename:
+                continue
+            with zf.open(zinfo) as src, open(os.path.join(upload_folder, filename), 'wb') as dest:
+                shutil.copyfileobj(src, dest, chunk_size)
+            count += 1
+
+    return count
+
+
+# ===== ルート定義 =====
+
+@backup_bp.route('/data.ndjson')
+def export_data():
+    """データのエクスポート（NDJSON）"""
+    filename = f"fashion-app-{date.today().isoformat()}.ndjson"
+    # ユーザーが未作成の訪問者は空のファイルになる
+    user_id = current_user_id()
+    return Response(
+        stream_with_context(iter_ndjson([user_id] if user_id else [])),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@backup_bp.route('/photos.zip')
+def export_photos():
+    """写真のエクスポート（ZIP）"""
+    filename = f"fashion-app-photos-{date.today().isoformat()}.zip"
+    # ユーザーが未作成の訪問者は空のZIPになる
+    user_id = current_user_id()
+    paths = _iter_upload_files(current_app.config['UPLOAD_FOLDER'], user_id) if user_id else []
+    return Response(
+        stream_with_context(iter_photos_zip(paths)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+# ===== CLIコマンド =====
+
+@backup_bp.cli.command('export')
+@click.argument('data_path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--photos', 'photos_path', type=click.Path(dir_okay=False, writable=True),
+              help='写真のZIPの出力先')
+@click.option('--user', 'user_id', help='対象のユーザーID（指定しない場合は全ユーザー）')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='1回の問い合わせで取得する行数')
+def export_command(data_path, photos_path, user_id, batch_size):
+    """データ（と写真）をファイルにエクスポート"""
+    user_ids = [user_id] if user_id else iter_tenant_ids()
+    with open(data_path, 'w', encoding='utf-8') as f:
+        for line in iter_ndjson(user_ids, batch_size=batch_size):
+            f.write(line)
+    click.echo(f'データを出力しました: {data_path}')
+
+    if photos_path:
+        with open(photos_path, 'wb') as f:
+            paths = _iter_upload_files(current_app.config['UPLOAD_FOLDER'], user_id)
+            for chunk in iter_photos_zip(paths):
+                f.write(chunk)
+        click.echo(f'写真を出力しました: {photos_path}')
+
+
+@backup_bp.cli.command('restore')
+@click.argument('data_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--photos', 'photos_path', type=click.Path(exists=True, dir_okay=False),
+              help='写真のZIP')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='1回のINSERTで投入する行数')
+@click.option('--replace', is_flag=True, help='各ユーザーの既存のデータを削除してから復元する')
+@click.option('--user', 'user_id',
+              help='user_id を持たない行（複数ユーザー対応前のバックアップ）の復元先ユーザーID（"new" で新規作成）')
+def restore_command(data_path, photos_path, batch_size, replace, user_id):
+    """エクスポートしたファイルからデータ（と写真）を復元"""
+    if user_id == 'new':
+        user_id = str(uuid.uuid4())
+    elif user_id is not None:
+        try:
+            user_id = str(uuid.UUID(user_id))
+        except ValueError:
+            raise click.BadParameter('ユーザーIDはUUIDで指定してください', param_hint='--user')
+
+    try:
+        with open(data_path, encoding='utf-8') as f:
+            counts = restore_ndjson(f, batch_size=batch_size, replace=replace, default_user_id=user_id)
+    except (ValueError, SQLAlchemyError) as e:
+        raise click.ClickException(
+            f'復元に失敗しました: {e}\n'
+            '復元済みのユーザーのデータは残っています。原因を取り除いて再実行すると残りを復元します。'
+        )
+    if user_id is not None:
+        click.echo(f'user_id のない行の復元先ユーザー: {user_id}')
+    for name, count in counts.items():
+        click.echo(f'{name}: {count}件を復元しました')
+
+    if photos_path:
+        count = restore_photos_zip(photos_path)
+        click.echo(f'写真: {count}件を復元しました')
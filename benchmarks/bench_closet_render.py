@@ -0,0 +1,92 @@
+"""
+クローゼット画面の描画時間を計測するベンチマーク
+
+服のカードのHTML断片キャッシュにより、描画し直すのが
+変更された服の分だけになっていることを確認する。
+
+使い方:
+    python benchmarks/bench_closet_render.py
+    python benchmarks/bench_closet_render.py --clothes 2000 --changed 1 10 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, Clothing  # noqa: E402
+from tenancy import tenant_context  # noqa: E402
+from bench_tenant_scaling import populate  # noqa: E402
+
+
+def measure(client, requests):
+    """クローゼット画面の応答時間（ミリ秒）の中央値を計測"""
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/closet')
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings)
+
+
+def change_clothes(app, user_id, count):
+    """服を count 件更新する"""
+    with app.app_context(), tenant_context(user_id):
+        clothes = Clothing.query.filter_by(user_id=user_id).limit(count).all()
+        for clothing in clothes:
+            clothing.color = '白' if clothing.color == '黒' else '黒'
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clothes', type=int, default=1000, help='服の数')
+    parser.add_argument('--changed', type=int, nargs='+', default=[0, 10, 100], help='描画前に更新する服の数')
+    parser.add_argument('--requests', type=int, default=20, help='計測するリクエスト数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+            UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+            JINJA_BYTECODE_CACHE_DIR = os.path.join(tmp, 'jinja_cache')
+            FRAGMENT_CACHE_SIZE = args.clothes
+            TENANT_DATABASE_DIR = None
+            OPENWEATHER_API_KEY = None
+
+        app = create_app(BenchConfig)
+        user_id = populate(app, 1, args.clothes)
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+        print(f'服の数: {args.clothes}')
+
+        # キャッシュなし（毎回全てのカードを描画）
+        timings = []
+        for _ in range(args.requests):
+            app.extensions['fragment_cache'].clear()
+            timings.append(measure(client, 1))
+        print(f'{"キャッシュなし":<16} {statistics.median(timings):>8.2f}ms')
+
+        measure(client, 1)
+        for changed in args.changed:
+            timings = []
+            for _ in range(args.requests):
+                change_clothes(app, user_id, changed)
+                timings.append(measure(client, 1))
+            print(f'{f"{changed}件変更後":<16} {statistics.median(timings):>8.2f}ms')
+
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
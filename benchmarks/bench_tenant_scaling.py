@@ -0,0 +1,117 @@
+"""
+ユーザー数を増やしたときのホーム画面の応答時間を計測するベンチマーク
+
+全ユーザーの服の総数が増えても、1ユーザーあたりの応答時間が
+変わらないこと（user_id を先頭にした複合インデックスで絞り込めていること）を確認する。
+
+使い方:
+    python benchmarks/bench_tenant_scaling.py
+    python benchmarks/bench_tenant_scaling.py --isolated  # ユーザーごとのDBファイル
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, User, Clothing  # noqa: E402
+from tenancy import tenant_context  # noqa: E402
+
+CATEGORIES = [('トップス', '半袖'), ('トップス', '長袖・薄手'), ('ボトムス', '短め'), ('ボトムス', '長め')]
+
+
+def populate(app, user_count, clothes_per_user):
+    """ユーザーと服を一括作成し、計測対象のユーザーIDを返す"""
+    now = datetime.utcnow()
+    user_ids = [str(uuid.uuid4()) for _ in range(user_count)]
+
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [{'id': user_id, 'created_at': now} for user_id in user_ids])
+        for user_id in user_ids:
+            rows = []
+            for i in range(clothes_per_user):
+                category, subcategory = CATEGORIES[i % len(CATEGORIES)]
+                rows.append({
+                    'id': str(uuid.uuid4()),
+                    'user_id': user_id,
+                    'photo_path': f'uploads/{uuid.uuid4()}_bench.jpg',
+                    'category': category,
+                    'subcategory': subcategory,
+                    'color': '黒',
+                    'purposes': '大学,企業',
+                    'last_worn_date': None,
+                    'created_at': now,
+                })
+            with tenant_context(user_id):
+                db.session.execute(Clothing.__table__.insert(), rows)
+        db.session.commit()
+
+    return user_ids[len(user_ids) // 2]
+
+
+def measure(client, path, requests):
+    """指定したパスの応答時間（ミリ秒）を計測"""
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings), statistics.quantiles(timings, n=20)[18]
+
+
+def run(user_count, clothes_per_user, requests, isolated):
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+            UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+            TENANT_DATABASE_DIR = os.path.join(tmp, 'tenants') if isolated else None
+            OPENWEATHER_API_KEY = None
+
+        app = create_app(BenchConfig)
+        user_id = populate(app, user_count, clothes_per_user)
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+        # ウォームアップ
+        measure(client, '/', 5)
+
+        home = measure(client, '/', requests)
+        closet = measure(client, '/closet', requests)
+
+        with app.app_context():
+            for engine in app.extensions.get('tenant_engines', {}).values():
+                engine.dispose()
+            db.engine.dispose()
+
+    return home, closet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 100, 1000], help='ユーザー数')
+    parser.add_argument('--clothes', type=int, default=40, help='1ユーザーあたりの服の数')
+    parser.add_argument('--requests', type=int, default=100, help='計測するリクエスト数')
+    parser.add_argument('--isolated', action='store_true', help='ユーザーごとのDBファイルを使う')
+    args = parser.parse_args()
+
+    print(f"{'ユーザー数':>10} {'服の総数':>10} {'/ 中央値':>10} {'/ p95':>8} {'/closet 中央値':>14} {'/closet p95':>12}")
+    for user_count in args.users:
+        (home_median, home_p95), (closet_median, closet_p95) = run(
+            user_count, args.clothes, args.requests, args.isolated
+        )
+        print(f"{user_count:>10} {user_count * args.clothes:>10} "
+              f"{home_median:>8.2f}ms {home_p95:>6.2f}ms {closet_median:>12.2f}ms {closet_p95:>10.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -19,11 +19,25 @@ class Config:
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'fashion_app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # ユーザーごとのデータベースファイルの保存先
+    # 設定した場合、服・予定・設定はユーザー専用のSQLiteファイルに保存される
+    TENANT_DATABASE_DIR = os.environ.get('TENANT_DATABASE_DIR')
+    TENANT_ENGINE_CACHE_SIZE = 128  # 保持するユーザー専用DBのエンジンの最大数
+    CLAIM_LINK_MAX_AGE = 7 * 24 * 60 * 60  # ユーザーの引き継ぎリンクの有効期限（秒）
+    
     # ファイルアップロード設定
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 最大16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
+    # 未参照画像のガベージコレクション設定
+    UPLOAD_GC_GRACE_SECONDS = 24 * 60 * 60  # 保存から24時間以内の画像は対象外
+    UPLOAD_GC_BATCH_SIZE = 500  # 1バッチあたりのファイル数
+    
+    # テンプレートキャッシュ設定
+    JINJA_BYTECODE_CACHE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'jinja_cache')
+    FRAGMENT_CACHE_SIZE = 2048  # キャッシュする服のHTML断片の最大数
+    
     # OpenWeatherMap API設定
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY')
     DEFAULT_CITY = os.environ.get('DEFAULT_CITY') or 'Tokyo'
@@ -0,0 +1,110 @@
+"""
+データベースの移行（起動時に実行）
+
+- 複数ユーザー対応前のデータベース（user_id のないテーブル）を現在の
+  スキーマに作り直し、既存の行を1人の引き継ぎ用ユーザーに割り当てる
+- TENANT_DATABASE_DIR の設定時は、メインDBに残っているユーザー単位の行を
+  各ユーザー専用のデータベースへ移す（共有DBからの切り替えにも対応）
+
+どちらも何度実行しても結果が変わらないため、途中で中断しても
+次回の起動時に続きから処理される。
+"""
+from datetime import datetime
+import uuid
+
+from flask import current_app
+import sqlalchemy as sa
+
+from models import db, User, UploadOwner, TENANT_TABLES, get_tenant_engine
+from tenancy import is_tenant_isolated
+
+
+def upgrade_database(batch_size=500):
+    """
+    データベースを現在のスキーマに移行
+
+    Args:
+        batch_size: ユーザー専用DBへ移す際の1回のINSERTの行数
+
+    Returns:
+        str: 既存の行を割り当てた引き継ぎ用ユーザーのID（移行しなかった場合はNone）
+    """
+    user_id = _upgrade_legacy_tables()
+    if user_id:
+        current_app.logger.warning(
+            '複数ユーザー対応前のデータを引き継ぎ用ユーザー %s に割り当てました。'
+            '"flask --app app users claim-link %s" で発行したリンクをブラウザで開くと引き継げます。',
+            user_id, user_id
+        )
+
+    if is_tenant_isolated():
+        _move_shared_rows_to_tenants(batch_size)
+
+    return user_id
+
+
+def _upgrade_legacy_tables():
+    """user_id のないテーブルを作り直し、既存の行を引き継ぎ用ユーザーに割り当てる"""
+    with db.engine.begin() as conn:
+        inspector = sa.inspect(conn)
+        existing = set(inspector.get_table_names())
+        legacy_tables = [
+            table for table in TENANT_TABLES
+            if table.name in existing
+            and 'user_id' not in {column['name'] for column in inspector.get_columns(table.name)}
+        ]
+        if not legacy_tables:
+            return None
+
+        user_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        conn.execute(User.__table__.insert(), [{'id': user_id, 'created_at': now}])
+
+        for table in legacy_tables:
+            legacy_name = f'{table.name}_legacy'
+            legacy_columns = {column['name'] for column in inspector.get_columns(table.name)}
+
+            # SQLiteは主キーやNOT NULLを変更できないため、作り直して行を写す
+            conn.execute(sa.text(f'ALTER TABLE "{table.name}" RENAME TO "{legacy_name}"'))
+            table.create(conn)
+
+            values = {'user_id': ':user_id', 'updated_at': ':now'}
+            columns = [column.name for column in table.columns
+                       if column.name in legacy_columns or column.name in values]
+            select_list = [f'"{name}"' if name in legacy_columns else values[name] for name in columns]
+            column_list = ', '.join(f'"{name}"' for name in columns)
+            stmt = sa.text(f'INSERT INTO "{table.name}" ({column_list}) '
+                           f'SELECT {", ".join(select_list)} FROM "{legacy_name}"')
+            if ':now' in select_list:
+                stmt = stmt.bindparams(sa.bindparam('now', type_=sa.DateTime))
+            conn.execute(stmt, {'user_id': user_id, 'now': now})
+            conn.execute(sa.text(f'DROP TABLE "{legacy_name}"'))
+
+        # 既存の画像の所有者を索引に登録
+        if 'clothing' in {table.name for table in legacy_tables}:
+            stmt = sa.text(f'INSERT OR IGNORE INTO "{UploadOwner.__tablename__}" (photo_path, user_id, created_at) '
+                           'SELECT photo_path, user_id, :now FROM clothing') \
+                .bindparams(sa.bindparam('now', type_=sa.DateTime))
+            conn.execute(stmt, {'now': now})
+
+    return user_id
+
+
+def _move_shared_rows_to_tenants(batch_size):
+    """メインDBに残っているユーザー単位の行を各ユーザー専用のデータベースへ移す"""
+    for table in TENANT_TABLES:
+        with db.engine.connect() as conn:
+            user_ids = conn.execute(sa.select(table.c.user_id).distinct()).scalars().all()
+
+        for user_id in user_ids:
+            insert = table.insert().prefix_with('OR IGNORE', dialect='sqlite')
+            with db.engine.connect() as conn, get_tenant_engine(user_id).begin() as tenant_conn:
+                result = conn.execute(
+                    sa.select(table).where(table.c.user_id == user_id).execution_options(yield_per=batch_size)
+                )
+                for rows in result.mappings().partitions():
+                    tenant_conn.execute(insert, [dict(row) for row in rows])
+
+            # ユーザー専用DBへのコミット後に削除する（中断しても行は失われない）
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.user_id == user_id))
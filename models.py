@@ -1,25 +1,123 @@
 """
 データベースモデル定義
 """
+from collections import OrderedDict
 from datetime import datetime
+import os
+import threading
+
+from flask import current_app, g
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+import sqlalchemy as sa
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.util import find_tables
 import uuid
 
-db = SQLAlchemy()
+
+class TenantSession(Session):
+    """
+    ユーザーごとのデータを振り分けるセッション
+    
+    TENANT_DATABASE_DIR が設定されている場合、ユーザー単位のテーブル
+    （info={'tenant': True}）への問い合わせを、現在のユーザー専用の
+    SQLiteファイルに振り分ける。書き込みのロックがユーザー間で競合しない。
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and current_app.config.get('TENANT_DATABASE_DIR'):
+            tables = []
+            if mapper is not None:
+                tables.append(sa.inspect(mapper).local_table)
+            if clause is not None:
+                tables.extend(find_tables(clause, include_crud=True))
+            
+            # ユーザーが未作成の訪問者の問い合わせ（常に空の結果になる）は
+            # メインDBに向け、ユーザー専用のファイルを作らない
+            if any(table.info.get('tenant') for table in tables) and g.get('user_id'):
+                return get_tenant_engine(g.user_id)
+        
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': TenantSession})
+
+_tenant_engines_lock = threading.Lock()
+
+
+def get_tenant_engine(user_id):
+    """
+    ユーザー専用データベースのエンジンを取得（テーブルがない場合は作成）
+
+    エンジンは TENANT_ENGINE_CACHE_SIZE 件までLRUで保持し、
+    あふれたものは破棄する。プールを使わないため、作り直しても負荷は小さい。
+
+    Args:
+        user_id: ユーザーID
+
+    Returns:
+        Engine: ユーザー専用のSQLiteエンジン
+    """
+    if not user_id:
+        raise RuntimeError('ユーザーが特定されていない状態でユーザー単位のテーブルにアクセスしました')
+
+    # ユーザーIDはファイル名に使うため、UUID以外は受け付けない
+    user_id = str(uuid.UUID(user_id))
+
+    with _tenant_engines_lock:
+        engines = current_app.extensions.setdefault('tenant_engines', OrderedDict())
+        engine = engines.get(user_id)
+        if engine is not None:
+            engines.move_to_end(user_id)
+            return engine
+
+        database_dir = current_app.config['TENANT_DATABASE_DIR']
+        os.makedirs(database_dir, exist_ok=True)
+        database_path = os.path.join(database_dir, f'{user_id}.db')
+
+        # ユーザー数に比例して接続が残らないよう、プールは使わない
+        engine = sa.create_engine('sqlite:///' + database_path, poolclass=NullPool)
+        # テーブル作成前に中断されたファイルも直るよう、エンジン作成のたびに確認する
+        db.metadata.create_all(engine, tables=TENANT_TABLES)
+
+        engines[user_id] = engine
+        while len(engines) > current_app.config.get('TENANT_ENGINE_CACHE_SIZE', 128):
+            _, evicted = engines.popitem(last=False)
+            evicted.dispose()
+
+    return engine
+
+
+class User(db.Model):
+    """ユーザーモデル"""
+    __tablename__ = 'users'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # 登録日時
+    
+    def __repr__(self):
+        return f'<User {self.id}>'
 
 
 class Clothing(db.Model):
     """服アイテムモデル"""
     __tablename__ = 'clothing'
+    __table_args__ = (
+        db.Index('ix_clothing_user_created', 'user_id', 'created_at'),
+        db.Index('ix_clothing_user_last_worn', 'user_id', 'last_worn_date'),
+        {'info': {'tenant': True}},
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    photo_path = db.Column(db.String(255), nullable=False)  # 画像ファイルパス
+    user_id = db.Column(db.String(36), nullable=False)  # 所有ユーザー
+    photo_path = db.Column(db.String(255), nullable=False, index=True)  # 画像ファイルパス
     category = db.Column(db.String(20), nullable=False)  # "トップス" | "ボトムス"
     subcategory = db.Column(db.String(20), nullable=False)  # "半袖" | "長袖・薄手" | "長袖・厚手" | "短め" | "長め"
     color = db.Column(db.String(50), nullable=False)  # "黒" | "白" | etc.
     purposes = db.Column(db.String(100), nullable=False)  # カンマ区切り: "大学,企業,デート"
     last_worn_date = db.Column(db.Date, nullable=True)  # 最終着用日
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # 登録日時
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # 更新日時（表示キャッシュのキー）
     
     def get_purposes_list(self):
         """用途ラベルをリストで取得"""
@@ -30,9 +128,11 @@ class Clothing(db.Model):
 
 
 class Settings(db.Model):
-    """アプリ設定モデル"""
+    """アプリ設定モデル（ユーザーごと）"""
     __tablename__ = 'settings'
+    __table_args__ = {'info': {'tenant': True}}
     
+    user_id = db.Column(db.String(36), primary_key=True)  # 所有ユーザー
     key = db.Column(db.String(50), primary_key=True)
     value = db.Column(db.String(255), nullable=False)
     
@@ -43,8 +143,13 @@ class Settings(db.Model):
 class Schedule(db.Model):
     """予定管理モデル"""
     __tablename__ = 'schedule'
+    __table_args__ = (
+        db.Index('ix_schedule_user_date', 'user_id', 'date'),
+        {'info': {'tenant': True}},
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), nullable=False)  # 所有ユーザー
     date = db.Column(db.Date, nullable=False)  # 予定の日付
     purpose = db.Column(db.String(20), nullable=False)  # "大学" | "企業" | "デート"
     memo = db.Column(db.String(200), nullable=True)  # メモ（オプション）
@@ -53,3 +158,26 @@ class Schedule(db.Model):
     def __repr__(self):
         return f'<Schedule {self.date}: {self.purpose}>'
 
+
+class UploadOwner(db.Model):
+    """
+    アップロード画像の所有者の索引（常にメインDBに保存）
+    
+    服の行より先にコミットし、服から参照されている画像が必ずここに
+    載っている状態を保つ。ガベージコレクションはこの索引から所有者を特定し、
+    1ファイルにつき1回の問い合わせで参照の有無を確認する。
+    """
+    __tablename__ = 'upload_owners'
+    
+    photo_path = db.Column(db.String(255), primary_key=True)  # 画像ファイルパス
+    user_id = db.Column(db.String(36), nullable=False)  # 所有ユーザー
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # 登録日時
+    
+    def __repr__(self):
+        return f'<UploadOwner {self.photo_path}: {self.user_id}>'
+
+
+# ユーザー単位のテーブル（TENANT_DATABASE_DIR 設定時はユーザー専用ファイルに保存）
+TENANT_TABLES = [
+    model.__table__ for model in (Clothing, Settings, Schedule)
+]
@@ -0,0 +1,353 @@
+"""
+アップロード画像の管理とガベージコレクション
+
+写真の原本は UPLOAD_FOLDER 直下に保存する。サムネイルなどの派生画像は
+UPLOAD_FOLDER のサブディレクトリ（例: uploads/thumbs/）に原本と同じ
+ファイル名で保存し、原本の参照（Clothing.photo_path）に従属させる。
+"""
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db, Clothing, UploadOwner
+from tenancy import is_tenant_isolated, tenant_context, iter_tenant_ids
+
+# DBに保存する写真パスの接頭辞（static/ からの相対パス）
+UPLOAD_PREFIX = 'uploads/'
+
+storage_cli = AppGroup('storage', help='アップロード画像の管理')
+
+
+# ===== パス操作 =====
+
+def to_upload_path(relative_path, upload_folder=None):
+    """DBに保存された相対パスを実ファイルのパスに変換"""
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    return os.path.join(upload_folder, os.path.basename(relative_path))
+
+
+def remove_upload(relative_path, upload_folder=None):
+    """
+    写真の原本と派生画像を削除
+
+    Args:
+        relative_path: DBに保存された相対パス（例: "uploads/xxx.jpg"）
+        upload_folder: 保存先（Noneの場合は設定から取得）
+    """
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    filename = os.path.basename(relative_path)
+
+    paths = [os.path.join(upload_folder, filename)]
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                paths.append(os.path.join(entry.path, filename))
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def register_uploads(relative_paths, user_id):
+    """
+    画像の所有者を索引に登録（コミットは呼び出し側で行う）
+
+    参照されている画像が必ず索引に載っているよう、服の行より先か、
+    服の行と同時にコミットする。
+
+    Args:
+        relative_paths: DBに保存する相対パスのリスト
+        user_id: 所有ユーザーのID
+    """
+    if not relative_paths:
+        return
+    stmt = UploadOwner.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite')
+    db.session.execute(stmt, [{'photo_path': path, 'user_id': user_id} for path in relative_paths])
+
+
+def unregister_uploads(relative_paths):
+    """
+    画像の所有者を索引から削除してコミット
+
+    服の行の削除・変更をコミットした後に呼び出す。
+
+    Args:
+        relative_paths: 相対パスのリスト
+    """
+    if not relative_paths:
+        return
+    stmt = UploadOwner.__table__.delete().where(UploadOwner.photo_path.in_(relative_paths))
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+# ===== 走査 =====
+
+def iter_upload_batches(upload_folder=None, batch_size=500):
+    """
+    アップロードフォルダを os.scandir で走査し、ファイルをバッチ単位で生成
+
+    フォルダ全体を一度に読み込まないため、ファイル数に関係なく
+    メモリ使用量はバッチサイズ分に収まる。
+
+    Args:
+        upload_folder: 走査するフォルダ（Noneの場合は設定から取得）
+        batch_size: 1バッチあたりのファイル数
+
+    Yields:
+        list: [(参照元の相対パス, 実ファイルのパス, 更新時刻), ...]
+    """
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    pending_dirs = [upload_folder]
+    batch = []
+
+    while pending_dirs:
+        with os.scandir(pending_dirs.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+
+                # 派生画像は同名の原本を参照元とする
+                batch.append((
+                    UPLOAD_PREFIX + entry.name,
+                    entry.path,
+                    entry.stat(follow_symlinks=False).st_mtime
+                ))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+    if batch:
+        yield batch
+
+
+def _query_referenced(relative_paths):
+    """指定した相対パスのうち服から参照されているものを1回の問い合わせで取得"""
+    stmt = db.select(Clothing.photo_path).where(Clothing.photo_path.in_(relative_paths))
+    referenced = set(db.session.execute(stmt).scalars())
+    # 読み取りトランザクションを閉じ、通常のリクエストの書き込みを妨げない
+    db.session.rollback()
+    return referenced
+
+
+def _find_referenced(relative_paths):
+    """
+    指定した相対パスのうちDBから参照されているものを取得
+
+    ユーザーごとにデータベースを分けている場合は、メインDBの所有者の索引を
+    1回引き、索引に載っている画像のみ所有者のデータベースで確認する
+    （バッチ内の所有者ごとに1回）。索引に載っていない画像は参照されていない。
+    """
+    if not is_tenant_isolated():
+        return _query_referenced(relative_paths)
+
+    stmt = db.select(UploadOwner.photo_path, UploadOwner.user_id) \
+        .where(UploadOwner.photo_path.in_(relative_paths))
+    paths_by_owner = {}
+    for photo_path, user_id in db.session.execute(stmt):
+        paths_by_owner.setdefault(user_id, set()).add(photo_path)
+    db.session.rollback()
+
+    referenced = set()
+    for user_id, owned_paths in paths_by_owner.items():
+        with tenant_context(user_id):
+            referenced |= _query_referenced(owned_paths)
+    return referenced
+
+
+def find_orphans(upload_folder=None, batch_size=500, grace_seconds=None):
+    """
+    どの服からも参照されていない画像をバッチ単位で検出
+
+    保存直後でまだコミットされていない画像を誤検出しないよう、
+    更新時刻が猶予期間内のファイルは対象外とする。
+
+    Args:
+        upload_folder: 走査するフォルダ（Noneの場合は設定から取得）
+        batch_size: 1バッチあたりのファイル数（DBへの問い合わせ件数の上限）
+        grace_seconds: 猶予期間（秒）（Noneの場合は設定から取得）
+
+    Yields:
+        list: 参照されていない実ファイルのパス
+    """
+    if grace_seconds is None:
+        grace_seconds = current_app.config['UPLOAD_GC_GRACE_SECONDS']
+
+    for batch in iter_upload_batches(upload_folder, batch_size):
+        threshold = time.time() - grace_seconds
+        candidates = [item for item in batch if item[2] < threshold]
+        if not candidates:
+            continue
+
+        referenced = _find_referenced({item[0] for item in candidates})
+        orphans = [path for relative_path, path, _ in candidates if relative_path not in referenced]
+        if orphans:
+            yield orphans
+
+
+def _iter_clothing_pages(batch_size, user_id=None):
+    """服の (ID, 相対パス) をIDによるキーセットページングで生成"""
+    last_id = ''
+
+    while True:
+        stmt = db.select(Clothing.id, Clothing.photo_path) \
+            .where(Clothing.id > last_id) \
+            .order_by(Clothing.id) \
+            .limit(batch_size)
+        if user_id is not None:
+            stmt = stmt.where(Clothing.user_id == user_id)
+        rows = db.session.execute(stmt).all()
+        db.session.rollback()
+        if not rows:
+            break
+
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _iter_tenant_clothing_pages(batch_size):
+    """ユーザーごとのデータベースを順に、服の (ID, 相対パス) をページ単位で生成"""
+    for user_id in iter_tenant_ids():
+        with tenant_context(user_id):
+            yield from _iter_clothing_pages(batch_size, user_id)
+
+
+def find_missing_photos(upload_folder=None, batch_size=500):
+    """
+    画像ファイルが存在しない服をバッチ単位で検出
+
+    IDによるキーセットページングで少しずつ読み出す。
+
+    Args:
+        upload_folder: 写真の保存先（Noneの場合は設定から取得）
+        batch_size: 1回の問い合わせで取得する件数
+
+    Yields:
+        list: [(服のID, 相対パス), ...]
+    """
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+
+    if is_tenant_isolated():
+        pages = _iter_tenant_clothing_pages(batch_size)
+    else:
+        pages = _iter_clothing_pages(batch_size)
+
+    for rows in pages:
+        missing = [(clothing_id, photo_path) for clothing_id, photo_path in rows
+                   if not os.path.exists(to_upload_path(photo_path, upload_folder))]
+        if missing:
+            yield missing
+
+
+def rebuild_upload_index(batch_size=500):
+    """
+    全ユーザーの服から画像の所有者の索引を作り直す
+
+    索引の導入前に登録された画像を、ユーザーごとのデータベースでの
+    ガベージコレクションより前に登録するために使う。
+
+    Args:
+        batch_size: 1回の問い合わせで取得する件数
+
+    Returns:
+        int: 確認した画像の数
+    """
+    count = 0
+    for user_id in iter_tenant_ids():
+        with tenant_context(user_id):
+            for rows in _iter_clothing_pages(batch_size, user_id):
+                register_uploads([photo_path for _, photo_path in rows], user_id)
+                db.session.commit()
+                count += len(rows)
+    return count
+
+
+def collect_garbage(upload_folder=None, batch_size=None, grace_seconds=None,
+                    delete=False, pause=0.0, report=None):
+    """
+    参照されていない画像を検出（delete=Trueの場合は削除）
+
+    Args:
+        upload_folder: 走査するフォルダ（Noneの場合は設定から取得）
+        batch_size: 1バッチあたりのファイル数（Noneの場合は設定から取得）
+        grace_seconds: 猶予期間（秒）（Noneの場合は設定から取得）
+        delete: Trueの場合は検出した画像を削除する
+        pause: バッチ間の待機時間（秒）。稼働中の負荷を抑えるために使う
+        report: 検出したファイルのパスを受け取る関数（オプション）
+
+    Returns:
+        dict: {
+            'orphans': 検出したファイル数,
+            'deleted': 削除したファイル数
+        }
+    """
+    batch_size = batch_size or current_app.config['UPLOAD_GC_BATCH_SIZE']
+    result = {'orphans': 0, 'deleted': 0}
+
+    for orphans in find_orphans(upload_folder, batch_size, grace_seconds):
+        result['orphans'] += len(orphans)
+        for path in orphans:
+            if report:
+                report(path)
+            if delete:
+                try:
+                    os.remove(path)
+                    result['deleted'] += 1
+                except FileNotFoundError:
+                    pass
+        if delete:
+            unregister_uploads({UPLOAD_PREFIX + os.path.basename(path) for path in orphans})
+        if pause:
+            time.sleep(pause)
+
+    return result
+
+
+# ===== CLIコマンド =====
+
+@storage_cli.command('gc')
+@click.option('--delete', is_flag=True, help='検出した画像を削除する（指定しない場合は一覧表示のみ）')
+@click.option('--batch-size', type=int, help='1バッチあたりのファイル数')
+@click.option('--grace', 'grace_seconds', type=int, help='猶予期間（秒）')
+@click.option('--pause', default=0.0, show_default=True, help='バッチ間の待機時間（秒）')
+def gc_command(delete, batch_size, grace_seconds, pause):
+    """参照されていない画像と、画像が存在しない服を検出"""
+    batch_size = batch_size or current_app.config['UPLOAD_GC_BATCH_SIZE']
+
+    result = collect_garbage(
+        batch_size=batch_size,
+        grace_seconds=grace_seconds,
+        delete=delete,
+        pause=pause,
+        report=lambda path: click.echo(f'未参照: {path}')
+    )
+    if delete:
+        click.echo(f'{result["deleted"]}件の画像を削除しました')
+    else:
+        click.echo(f'{result["orphans"]}件の未参照画像が見つかりました')
+
+    missing_count = 0
+    for missing in find_missing_photos(batch_size=batch_size):
+        for clothing_id, photo_path in missing:
+            click.echo(f'画像なし: {clothing_id} ({photo_path})')
+        missing_count += len(missing)
+    click.echo(f'{missing_count}件の服の画像が見つかりませんでした')
+
+
+@storage_cli.command('reindex')
+@click.option('--batch-size', type=int, help='1回の問い合わせで取得する件数')
+def reindex_command(batch_size):
+    """画像の所有者の索引を全ユーザーの服から作り直す"""
+    batch_size = batch_size or current_app.config['UPLOAD_GC_BATCH_SIZE']
+    count = rebuild_upload_index(batch_size)
+    click.echo(f'{count}件の画像の所有者を確認しました')
@@ -0,0 +1,113 @@
+"""
+テンプレート描画の高速化
+
+- Jinjaのバイトコードをファイルに保存し、ワーカー起動時の再コンパイルを省く
+- 服ごとのカードのHTMLを (服のID, 更新日時) をキーにキャッシュし、
+  変更があった服のカードのみ描画し直す
+"""
+from collections import OrderedDict
+import os
+import threading
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """
+    服ごとのHTML断片のキャッシュ（LRU）
+
+    エントリは (テンプレート名, 服のID) ごとに1つだけ持ち、
+    更新日時が一致しない場合は古いものとして描画し直す。
+    """
+
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, template_name, clothing, render):
+        """
+        キャッシュされたHTMLを取得（ない場合は描画して保存）
+
+        Args:
+            template_name: テンプレート名
+            clothing: Clothingモデル
+            render: HTMLを描画する関数
+
+        Returns:
+            Markup: HTML
+        """
+        key = (template_name, clothing.id)
+        version = clothing.updated_at
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        html = Markup(render())
+
+        with self._lock:
+            self._entries[key] = (version, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return html
+
+    def invalidate(self, *clothing_ids):
+        """服のHTMLをキャッシュから削除"""
+        clothing_ids = set(clothing_ids)
+        with self._lock:
+            for key in [key for key in self._entries if key[1] in clothing_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        """キャッシュを全て削除"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_template_cache(app):
+    """
+    テンプレートのキャッシュを設定
+
+    バイトコードキャッシュはJinja環境の生成前に設定する必要があるため、
+    アプリケーション作成直後に呼び出す。
+    """
+    cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(cache_dir)}
+
+    app.extensions['fragment_cache'] = FragmentCache(app.config.get('FRAGMENT_CACHE_SIZE', 2048))
+    app.add_template_global(render_clothing_fragment)
+
+
+def render_clothing_fragment(template_name, clothing):
+    """
+    服のHTML断片を描画（テンプレートから呼び出す）
+
+    Args:
+        template_name: 断片のテンプレート名（例: "_clothing_card.html"）
+        clothing: Clothingモデル
+
+    Returns:
+        Markup: HTML
+    """
+    return current_app.extensions['fragment_cache'].get_or_render(
+        template_name,
+        clothing,
+        lambda: current_app.jinja_env.get_template(template_name).render(clothing=clothing)
+    )
+
+
+def invalidate_clothing(*clothing_ids):
+    """服の変更・削除時にHTML断片のキャッシュを削除"""
+    current_app.extensions['fragment_cache'].invalidate(*clothing_ids)
@@ -0,0 +1,165 @@
+"""
+マルチユーザー対応（ユーザー単位のデータ分離）
+
+服・予定・設定はすべてユーザー単位で保存する。ルートからは必ず
+このモジュールのヘルパー経由で問い合わせ、他のユーザーのデータに
+触れないようにする。
+"""
+from contextlib import contextmanager
+import uuid
+
+from flask import abort, current_app, g, session
+import sqlalchemy as sa
+
+from models import db, User, Settings
+
+
+def load_current_user():
+    """
+    リクエストのユーザーを特定して g.user_id に設定（before_request用）
+
+    ユーザーはここでは作成しない。セッションにユーザーIDがない
+    （または存在しないユーザーの）訪問者は g.user_id が None になり、
+    空のクローゼットとして扱われる。ユーザーは最初の書き込み時に
+    ensure_current_user() で作成する。
+    セッションのCookieは署名されているため、ユーザーIDは改ざんされない。
+    """
+    user_id = session.get('user_id')
+    if user_id and db.session.get(User, user_id) is None:
+        user_id = None
+
+    g.user_id = user_id
+
+
+def current_user_id():
+    """現在のユーザーIDを取得（ユーザーが未作成の場合はNone）"""
+    return g.get('user_id')
+
+
+def ensure_current_user():
+    """
+    現在のユーザーIDを取得（未作成の場合は作成してセッションに保存）
+
+    書き込みを行うルートから呼び出す。ユーザーの行は呼び出し側の
+    コミットで一緒に保存される。
+
+    Returns:
+        str: ユーザーID
+    """
+    user_id = g.get('user_id')
+    if user_id:
+        return user_id
+
+    user_id = str(uuid.uuid4())
+    db.session.add(User(id=user_id))
+    session['user_id'] = user_id
+    session.permanent = True
+    g.user_id = user_id
+    return user_id
+
+
+def is_tenant_isolated():
+    """ユーザーごとに別のデータベースファイルを使う設定かどうか"""
+    return bool(current_app.config.get('TENANT_DATABASE_DIR'))
+
+
+@contextmanager
+def tenant_context(user_id):
+    """
+    指定したユーザーとして処理するコンテキスト（CLIなどリクエスト外で使用）
+
+    Args:
+        user_id: ユーザーID
+    """
+    previous = g.get('user_id')
+    g.user_id = user_id
+    try:
+        yield
+    finally:
+        g.user_id = previous
+
+
+def iter_tenant_ids(batch_size=500):
+    """
+    全ユーザーのIDをキーセットページングで生成
+
+    Args:
+        batch_size: 1回の問い合わせで取得する件数
+
+    Yields:
+        str: ユーザーID
+    """
+    last_id = ''
+    while True:
+        stmt = db.select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        user_ids = db.session.execute(stmt).scalars().all()
+        if not user_ids:
+            break
+        yield from user_ids
+        last_id = user_ids[-1]
+
+
+# ===== クエリヘルパー =====
+
+def tenant_query(model):
+    """
+    現在のユーザーのデータに絞り込んだクエリを取得
+
+    ユーザーが未作成の場合は常に空の結果を返す
+    （ユーザー専用のデータベースファイルには触れない）。
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return model.query.filter(sa.false())
+    return model.query.filter_by(user_id=user_id)
+
+
+def get_tenant_or_404(model, object_id):
+    """現在のユーザーのデータをIDで取得（存在しない場合は404）"""
+    if current_user_id() is None:
+        abort(404)
+    obj = tenant_query(model).filter_by(id=object_id).first()
+    if obj is None:
+        abort(404)
+    return obj
+
+
+def get_setting(key, default=None):
+    """
+    現在のユーザーの設定値を取得
+
+    Args:
+        key: 設定キー
+        default: 未設定の場合の値
+
+    Returns:
+        str: 設定値
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return default
+    setting = db.session.get(Settings, (user_id, key))
+    return setting.value if setting else default
+
+
+def set_setting(key, value):
+    """
+    現在のユーザーの設定値を保存（コミットは呼び出し側で行う）
+
+    Args:
+        key: 設定キー
+        value: 設定値（文字列に変換して保存。Noneの場合は設定を削除）
+    """
+    if value is None:
+        user_id = current_user_id()
+        setting = db.session.get(Settings, (user_id, key)) if user_id else None
+        if setting is not None:
+            db.session.delete(setting)
+        return
+
+    user_id = ensure_current_user()
+    setting = db.session.get(Settings, (user_id, key))
+    if setting is None:
+        setting = Settings(user_id=user_id, key=key)
+        db.session.add(setting)
+    setting.value = str(value)
@@ -0,0 +1,67 @@
+"""
+テスト共通のフィクスチャ
+"""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, Clothing  # noqa: E402
+from tenancy import tenant_context  # noqa: E402
+
+
+def make_app(tmp_path, mode):
+    """テスト用のアプリを作成（mode: "shared" または "isolated"）"""
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        TENANT_DATABASE_DIR = str(tmp_path / 'tenants') if mode == 'isolated' else None
+        JINJA_BYTECODE_CACHE_DIR = None
+        OPENWEATHER_API_KEY = None
+
+    return create_app(TestConfig)
+
+
+def dispose_app(app):
+    """アプリのデータベース接続を閉じる"""
+    with app.app_context():
+        for engine in app.extensions.get('tenant_engines', {}).values():
+            engine.dispose()
+        db.engine.dispose()
+
+
+@pytest.fixture(params=['shared', 'isolated'])
+def mode(request):
+    """共有DBとユーザーごとのDBの両方のモードで実行"""
+    return request.param
+
+
+@pytest.fixture
+def app(mode, tmp_path):
+    app = make_app(tmp_path, mode)
+    yield app
+    dispose_app(app)
+
+
+def add_clothing(client, color='黒'):
+    """服を登録し、(ユーザーID, 服のID) を返す"""
+    response = client.post('/closet/add', data={
+        'category': 'トップス',
+        'subcategory': '半袖',
+        'color': color,
+        'purposes': ['大学'],
+        'photo': (io.BytesIO(b'photo'), 'shirt.jpg'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    with client.application.app_context(), tenant_context(user_id):
+        clothing = Clothing.query.filter_by(user_id=user_id).order_by(Clothing.created_at.desc()).first()
+        return user_id, clothing.id
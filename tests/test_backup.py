@@ -0,0 +1,124 @@
+"""
+バックアップ（エクスポート／リストア）のテスト
+"""
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from backup import iter_ndjson, restore_ndjson
+from models import Clothing
+from tenancy import tenant_context
+
+from conftest import add_clothing, dispose_app, make_app
+
+
+@pytest.fixture
+def source(mode, tmp_path):
+    """服・予定・設定を登録したユーザーがいるアプリ"""
+    app = make_app(tmp_path / 'source', mode)
+    client = app.test_client()
+    for color in ('黒', '白'):
+        add_clothing(client, color=color)
+    client.post('/calendar/add', data={'date': '2030-01-01', 'purpose': 'デート', 'memo': 'テスト'})
+    client.post('/update-location', json={'latitude': 35.0, 'longitude': 139.0, 'city': 'Tokyo'})
+    yield app, client
+    dispose_app(app)
+
+
+@pytest.fixture
+def target(mode, tmp_path):
+    """空のアプリ（リストア先）"""
+    app = make_app(tmp_path / 'target', mode)
+    yield app
+    dispose_app(app)
+
+
+def _export(app, user_id):
+    with app.app_context():
+        return list(iter_ndjson([user_id]))
+
+
+def _clothing_count(app, user_id):
+    with app.app_context(), tenant_context(user_id):
+        return Clothing.query.filter_by(user_id=user_id).count()
+
+
+def test_failed_replace_restore_keeps_user_data(app):
+    client = app.test_client()
+    for _ in range(3):
+        user_id, _ = add_clothing(client)
+    lines = _export(app, user_id)
+
+    # ユーザーの行と服1件の後に不正な行（服の投入後に失敗する）
+    with app.app_context(), pytest.raises(ValueError, match='3行目'):
+        restore_ndjson(lines[:2] + ['{bad\n'], batch_size=1, replace=True)
+
+    assert _clothing_count(app, user_id) == 3
+
+
+def test_round_trip_into_fresh_database(source, target):
+    app, client = source
+    lines = client.get('/backup/data.ndjson').get_data(as_text=True).splitlines(keepends=True)
+    assert {json.loads(line)['table'] for line in lines} == {'users', 'clothing', 'schedule', 'settings'}
+
+    with target.app_context():
+        counts = restore_ndjson(lines)
+    assert counts == {'users': 1, 'clothing': 2, 'schedule': 1, 'settings': 3}
+
+    user_id = json.loads(lines[0])['data']['id']
+    assert sorted(_export(target, user_id)) == sorted(lines)
+
+    # 2回目は全ての行がスキップされる
+    with target.app_context():
+        counts = restore_ndjson(lines)
+    assert counts == {'users': 0, 'clothing': 0, 'schedule': 0, 'settings': 0}
+
+
+def test_legacy_backup_requires_user_option(target, tmp_path):
+    legacy = tmp_path / 'legacy.ndjson'
+    legacy.write_text(
+        json.dumps({'table': 'clothing', 'data': {
+            'id': 'c1', 'photo_path': 'uploads/old.jpg', 'category': 'トップス', 'subcategory': '半袖',
+            'color': '紺', 'purposes': '大学', 'last_worn_date': None, 'created_at': '2024-01-01T00:00:00',
+        }}, ensure_ascii=False) + '\n'
+        + json.dumps({'table': 'settings', 'data': {'key': 'user_city', 'value': 'Osaka'}}) + '\n',
+        encoding='utf-8'
+    )
+    runner = target.test_cli_runner()
+
+    result = runner.invoke(args=['backup', 'restore', str(legacy)])
+    assert result.exit_code != 0
+    assert '1行目' in result.output and '--user' in result.output
+
+    result = runner.invoke(args=['backup', 'restore', str(legacy), '--user', 'new'])
+    assert result.exit_code == 0, result.output
+    assert 'clothing: 1件' in result.output and 'settings: 1件' in result.output
+
+    user_id = result.output.split('復元先ユーザー: ')[1].split()[0]
+    assert _clothing_count(target, user_id) == 1
+
+
+def test_malformed_line_names_line_number(target):
+    lines = ['\n', '{"table": "clothing"}\n']
+    with target.app_context(), pytest.raises(ValueError, match='2行目'):
+        restore_ndjson(lines)
+
+
+def test_photos_zip_contains_user_photos(source):
+    app, client = source
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    with app.app_context(), tenant_context(user_id):
+        expected = {os.path.basename(c.photo_path) for c in Clothing.query.filter_by(user_id=user_id)}
+
+    # 他のユーザーの写真は含まれない
+    add_clothing(app.test_client())
+
+    response = client.get('/backup/photos.zip')
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.testzip() is None
+        assert set(zf.namelist()) == expected
@@ -0,0 +1,105 @@
+"""
+複数ユーザー対応前のデータベースの移行とユーザーの引き継ぎのテスト
+"""
+import re
+import sqlite3
+
+from models import db, User, Clothing, Settings, Schedule, UploadOwner
+from tenancy import tenant_context
+
+from conftest import add_clothing, dispose_app, make_app
+
+# 複数ユーザー対応前のスキーマ
+LEGACY_SCHEMA = """
+CREATE TABLE clothing (
+    id VARCHAR(36) NOT NULL PRIMARY KEY,
+    photo_path VARCHAR(255) NOT NULL,
+    category VARCHAR(20) NOT NULL,
+    subcategory VARCHAR(20) NOT NULL,
+    color VARCHAR(50) NOT NULL,
+    purposes VARCHAR(100) NOT NULL,
+    last_worn_date DATE,
+    created_at DATETIME
+);
+CREATE TABLE settings (
+    "key" VARCHAR(50) NOT NULL PRIMARY KEY,
+    value VARCHAR(255) NOT NULL
+);
+CREATE TABLE schedule (
+    id VARCHAR(36) NOT NULL PRIMARY KEY,
+    date DATE NOT NULL,
+    purpose VARCHAR(20) NOT NULL,
+    memo VARCHAR(200),
+    created_at DATETIME
+);
+INSERT INTO clothing VALUES ('c1', 'uploads/old.jpg', 'トップス', '半袖', '紺', '大学', NULL, '2024-01-01 00:00:00.000000');
+INSERT INTO settings VALUES ('user_city', 'Osaka');
+INSERT INTO schedule VALUES ('s1', '2024-01-02', 'デート', NULL, '2024-01-01 00:00:00.000000');
+"""
+
+
+def _make_legacy_app(tmp_path, mode):
+    with sqlite3.connect(tmp_path / 'test.db') as conn:
+        conn.executescript(LEGACY_SCHEMA)
+    return make_app(tmp_path, mode)
+
+
+def _claim(app, client, user_id):
+    result = app.test_cli_runner().invoke(args=['users', 'claim-link', user_id])
+    assert result.exit_code == 0, result.output
+    path = re.search(r'http://localhost:5000(/claim/\S+)', result.output).group(1)
+    return client.get(path)
+
+
+def test_legacy_rows_move_to_bootstrap_user(mode, tmp_path):
+    app = _make_legacy_app(tmp_path, mode)
+    try:
+        with app.app_context():
+            user_id = User.query.one().id
+            assert db.session.get(UploadOwner, 'uploads/old.jpg').user_id == user_id
+            with tenant_context(user_id):
+                assert db.session.get(Clothing, 'c1').color == '紺'
+                assert db.session.get(Settings, (user_id, 'user_city')).value == 'Osaka'
+                assert db.session.get(Schedule, 's1').user_id == user_id
+
+        # 引き継ぎリンクを開いたブラウザから既存のデータを操作できる
+        client = app.test_client()
+        assert _claim(app, client, user_id).status_code == 302
+        assert '紺' in client.get('/closet').get_data(as_text=True)
+        add_clothing(client)
+        with app.app_context(), tenant_context(user_id):
+            assert Clothing.query.filter_by(user_id=user_id).count() == 2
+    finally:
+        dispose_app(app)
+
+    # 2回目の起動では何もしない
+    app = make_app(tmp_path, mode)
+    try:
+        with app.app_context():
+            assert User.query.count() == 1
+    finally:
+        dispose_app(app)
+
+
+def test_switching_to_isolated_moves_rows(tmp_path):
+    app = make_app(tmp_path, 'shared')
+    client = app.test_client()
+    user_id, clothing_id = add_clothing(client)
+    dispose_app(app)
+
+    app = make_app(tmp_path, 'isolated')
+    try:
+        with app.app_context():
+            assert db.session.execute(db.select(Clothing.__table__)).first() is None
+            with tenant_context(user_id):
+                assert db.session.get(Clothing, clothing_id) is not None
+    finally:
+        dispose_app(app)
+
+
+def test_invalid_claim_link_is_rejected(app):
+    client = app.test_client()
+    response = client.get('/claim/invalid-token', follow_redirects=True)
+    assert '引き継ぎリンクが無効' in response.get_data(as_text=True)
+    with client.session_transaction() as sess:
+        assert 'user_id' not in sess
@@ -0,0 +1,109 @@
+"""
+未参照画像のガベージコレクションのテスト
+"""
+import os
+import time
+
+import pytest
+
+from models import db, Clothing
+from storage import collect_garbage, find_missing_photos, rebuild_upload_index
+from tenancy import tenant_context
+
+from conftest import add_clothing
+
+GRACE_SECONDS = 60 * 60
+
+
+def _write_upload(app, name, age_seconds=2 * GRACE_SECONDS):
+    """アップロードフォルダにファイルを作成し、更新時刻を age_seconds 前にする"""
+    path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'photo')
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def _photo_path(app, user_id, clothing_id):
+    with app.app_context(), tenant_context(user_id):
+        photo_path = db.session.get(Clothing, clothing_id).photo_path
+    return os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(photo_path))
+
+
+def _gc(app, delete=True):
+    with app.app_context():
+        return collect_garbage(grace_seconds=GRACE_SECONDS, delete=delete)
+
+
+def test_old_orphan_is_deleted(app):
+    orphan = _write_upload(app, 'orphan.jpg')
+
+    assert _gc(app, delete=False) == {'orphans': 1, 'deleted': 0}
+    assert os.path.exists(orphan)
+
+    assert _gc(app) == {'orphans': 1, 'deleted': 1}
+    assert not os.path.exists(orphan)
+
+
+def test_referenced_photo_and_thumbnail_are_kept(app):
+    user_id, clothing_id = add_clothing(app.test_client())
+    photo = _photo_path(app, user_id, clothing_id)
+    mtime = time.time() - 2 * GRACE_SECONDS
+    os.utime(photo, (mtime, mtime))
+    thumbnail = _write_upload(app, os.path.join('thumbs', os.path.basename(photo)))
+
+    assert _gc(app) == {'orphans': 0, 'deleted': 0}
+    assert os.path.exists(photo)
+    assert os.path.exists(thumbnail)
+
+
+def test_file_within_grace_period_is_kept(app):
+    recent = _write_upload(app, 'recent.jpg', age_seconds=0)
+
+    assert _gc(app) == {'orphans': 0, 'deleted': 0}
+    assert os.path.exists(recent)
+
+
+def test_isolated_mode_uses_owner_index(app, mode):
+    if mode != 'isolated':
+        pytest.skip('ユーザーごとのDBのみ')
+
+    user_id, clothing_id = add_clothing(app.test_client())
+    owned = _photo_path(app, user_id, clothing_id)
+    mtime = time.time() - 2 * GRACE_SECONDS
+    os.utime(owned, (mtime, mtime))
+    unindexed = _write_upload(app, 'unindexed.jpg')
+
+    assert _gc(app) == {'orphans': 1, 'deleted': 1}
+    assert os.path.exists(owned)
+    assert not os.path.exists(unindexed)
+
+
+def test_reindex_protects_photos_added_without_index(app, mode):
+    if mode != 'isolated':
+        pytest.skip('ユーザーごとのDBのみ')
+
+    user_id, _ = add_clothing(app.test_client())
+    legacy = _write_upload(app, 'legacy.jpg')
+    with app.app_context(), tenant_context(user_id):
+        db.session.add(Clothing(user_id=user_id, photo_path='uploads/legacy.jpg', category='トップス',
+                                subcategory='半袖', color='黒', purposes='大学'))
+        db.session.commit()
+
+    with app.app_context():
+        assert rebuild_upload_index() == 2
+
+    assert _gc(app) == {'orphans': 0, 'deleted': 0}
+    assert os.path.exists(legacy)
+
+
+def test_missing_photo_is_reported(app):
+    user_id, clothing_id = add_clothing(app.test_client())
+    photo = _photo_path(app, user_id, clothing_id)
+    os.remove(photo)
+
+    with app.app_context():
+        missing = [item for batch in find_missing_photos() for item in batch]
+    assert missing == [(clothing_id, 'uploads/' + os.path.basename(photo))]
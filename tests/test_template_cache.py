@@ -0,0 +1,61 @@
+"""
+服ごとのHTML断片キャッシュのテスト
+"""
+from datetime import datetime, timedelta
+
+from models import db, Clothing
+from template_cache import invalidate_clothing
+from tenancy import tenant_context
+
+from conftest import add_clothing
+
+
+def _change_color_without_touching_cache(app, user_id, clothing_id, color, updated_at=None):
+    """キャッシュの無効化を通さずにDBの色を書き換える"""
+    with app.app_context(), tenant_context(user_id):
+        values = {'color': color}
+        if updated_at is not None:
+            values['updated_at'] = updated_at
+        else:
+            # onupdate で更新日時が変わらないよう、現在の値をそのまま指定する
+            values['updated_at'] = db.session.get(Clothing, clothing_id).updated_at
+        db.session.execute(
+            db.update(Clothing).where(Clothing.id == clothing_id).values(**values)
+        )
+        db.session.commit()
+
+
+def test_card_rerenders_when_updated_at_changes(app):
+    client = app.test_client()
+    user_id, clothing_id = add_clothing(client, color='黒')
+    assert '黒' in client.get('/closet').get_data(as_text=True)
+
+    # 更新日時が同じ間はキャッシュされたカードが返る
+    _change_color_without_touching_cache(app, user_id, clothing_id, '白')
+    assert '白' not in client.get('/closet').get_data(as_text=True)
+
+    _change_color_without_touching_cache(app, user_id, clothing_id, '白',
+                                         updated_at=datetime.utcnow() + timedelta(seconds=1))
+    assert '白' in client.get('/closet').get_data(as_text=True)
+
+
+def test_card_rerenders_after_invalidate(app):
+    client = app.test_client()
+    user_id, clothing_id = add_clothing(client, color='黒')
+    assert '黒' in client.get('/closet').get_data(as_text=True)
+
+    _change_color_without_touching_cache(app, user_id, clothing_id, '白')
+    with app.app_context():
+        invalidate_clothing(clothing_id)
+    assert '白' in client.get('/closet').get_data(as_text=True)
+
+
+def test_update_route_rerenders_card(app):
+    client = app.test_client()
+    _, clothing_id = add_clothing(client, color='黒')
+    assert '黒' in client.get('/closet').get_data(as_text=True)
+
+    client.post(f'/closet/update/{clothing_id}', data={
+        'category': 'トップス', 'subcategory': '半袖', 'color': '白', 'purposes': ['大学'],
+    })
+    assert '白' in client.get('/closet').get_data(as_text=True)
@@ -0,0 +1,61 @@
+"""
+ユーザーごとのデータの分離のテスト
+"""
+import os
+import uuid
+
+import pytest
+
+from models import db, User, Clothing
+from tenancy import tenant_context
+
+from conftest import add_clothing
+
+
+def test_other_user_cannot_edit_or_delete(app):
+    owner = app.test_client()
+    owner_id, clothing_id = add_clothing(owner)
+
+    other = app.test_client()
+    add_clothing(other)
+
+    assert other.get(f'/closet/edit/{clothing_id}').status_code == 404
+    assert other.post(f'/closet/update/{clothing_id}', data={
+        'category': 'ボトムス', 'subcategory': '長め', 'color': '白', 'purposes': ['企業'],
+    }).status_code == 404
+    assert other.post(f'/closet/delete/{clothing_id}').status_code == 404
+
+    with app.app_context(), tenant_context(owner_id):
+        clothing = db.session.get(Clothing, clothing_id)
+        assert clothing is not None
+        assert clothing.color == '黒'
+
+    assert owner.get(f'/closet/edit/{clothing_id}').status_code == 200
+
+
+def test_anonymous_visitor_sees_empty_closet_without_creating_user(app):
+    owner = app.test_client()
+    _, clothing_id = add_clothing(owner)
+
+    visitor = app.test_client()
+    assert visitor.get('/closet').status_code == 200
+    assert visitor.get(f'/closet/edit/{clothing_id}').status_code == 404
+
+    with app.app_context():
+        assert User.query.count() == 1
+
+
+def test_tenant_database_without_tables_is_repaired(app):
+    if not app.config['TENANT_DATABASE_DIR']:
+        pytest.skip('ユーザーごとのDBのみ')
+
+    # テーブル作成前に中断された空のファイル
+    user_id = str(uuid.uuid4())
+    os.makedirs(app.config['TENANT_DATABASE_DIR'], exist_ok=True)
+    open(os.path.join(app.config['TENANT_DATABASE_DIR'], f'{user_id}.db'), 'wb').close()
+
+    with app.app_context():
+        db.session.add(User(id=user_id))
+        db.session.commit()
+        with tenant_context(user_id):
+            assert Clothing.query.filter_by(user_id=user_id).count() == 0